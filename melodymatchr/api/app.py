@@ -1,13 +1,24 @@
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import json
+import os
+import secrets
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from song_similarity import Song as SongClass, cosine_similarity, SongMatcher, SongPredictor, SongMatcherHashTable
+from song_similarity import Song as SongClass, cosine_similarity, SongPredictor, SongMatcherHashTable, SongMatcherPartialSort, SongMatcherStreaming, composite_bound, DiversityReranker, NearDuplicateDetector
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 
 from data_structures import *
+from profiling import RequestProfiler
+
+try:
+    import orjson  # optional: much faster JSON encoding for large result pages
+except ImportError:
+    orjson = None
 
 import kagglehub
 
@@ -39,6 +50,47 @@ all_feature_cols = feature_cols + genre_cols
 scaler = MinMaxScaler()
 df[all_feature_cols] = scaler.fit_transform(df[all_feature_cols])
 
+## Near-duplicate detection ##
+
+# Remasters, live versions and re-uploads survive the exact (track_name, artists) dedup above.
+# Tracks by the same primary artist whose normalized titles match and whose audio features are
+# near-identical are collapsed into one canonical track, found with SimHash LSH instead of
+# comparing every pair.
+DEDUP_SIMILARITY_THRESHOLD = 0.995
+# Which track of a group is kept: 'first' (dataset order) or a numeric column whose highest value wins
+DEDUP_KEEP = 'popularity'
+
+df = df.reset_index(drop=True)
+detector = NearDuplicateDetector(threshold=DEDUP_SIMILARITY_THRESHOLD)
+near_duplicate_groups = detector.find_groups(df[feature_cols].values, df['track_name'].values,
+                                             df['artists'].values)
+
+duplicate_groups = {}  # canonical track_id -> [{"id", "name", "artist"} of collapsed tracks]
+duplicate_of = {}      # collapsed track_id -> canonical track_id
+duplicate_positions = []
+for group in near_duplicate_groups:
+    if DEDUP_KEEP == 'first':
+        canonical = group[0]
+    else:
+        canonical = group[int(np.argmax(df[DEDUP_KEEP].values[group]))]
+    canonical_id = df.at[canonical, 'track_id']
+
+    duplicate_groups[canonical_id] = []
+    for pos in group:
+        if pos == canonical:
+            continue
+        track_id = df.at[pos, 'track_id']
+        duplicate_of[track_id] = canonical_id
+        duplicate_groups[canonical_id].append({
+            "id": track_id,
+            "name": df.at[pos, 'track_name'],
+            "artist": df.at[pos, 'artists']
+        })
+        duplicate_positions.append(pos)
+
+df = df.drop(index=duplicate_positions)
+print(f"Collapsed {len(duplicate_positions)} near-duplicate tracks into {len(duplicate_groups)} canonical tracks")
+
 # Keep metadata columns
 df_clean = df[['track_id', 'track_name', 'artists'] + all_feature_cols].copy()
 
@@ -57,7 +109,8 @@ for idx, row in df_clean.iterrows():
         song_id=row['track_id'],
         name=row['track_name'],
         artist=row['artists'],
-        features=features
+        features=features,
+        index=len(song_database)
     )
     song_database.append(song_obj)
 
@@ -72,6 +125,82 @@ for idx, row in df_clean.iterrows():
 
 print(f"Indexed {len(song_database)} songs with BST feature indexing")
 
+# Searching for a collapsed duplicate by name resolves to its canonical track
+song_by_id = {song.id: song for song in song_database}
+for canonical_id, duplicates in duplicate_groups.items():
+    for duplicate in duplicates:
+        song_name_bst.insert(duplicate["name"].lower(), song_by_id[canonical_id])
+
+## Bitmap indexes for filtered search ##
+
+# Composite score per song position, same formula as the feature_bst key
+composite_scores = (df_clean['danceability'].values + df_clean['energy'].values
+                    + df_clean['valence'].values) / 3.0
+
+# Genres: one bitmap per genre_* column
+genre_index = BitmapIndex(len(song_database))
+for col in genre_cols:
+    genre_index.add_mask(col[len('genre_'):].lower(), df_clean[col].values > 0.5)
+
+# Artists: one bitmap per individual artist ("A;B" credits both A and B)
+artist_index = BitmapIndex(len(song_database))
+artist_positions = {}
+for song in song_database:
+    for artist in song.artist.split(';'):
+        artist_positions.setdefault(artist.strip().lower(), []).append(song.index)
+for artist, positions in artist_positions.items():
+    artist_index.add(artist, positions)
+del artist_positions
+
+# Audio features: each normalized feature is split into FEATURE_BUCKETS equal-width
+# buckets, keyed by (feature, bucket). Range filters OR the buckets they cover and
+# only compare exact values for songs in the two edge buckets.
+FEATURE_BUCKETS = 10
+feature_values = {col: df_clean[col].values.astype(float) for col in feature_cols}
+feature_bucket_index = BitmapIndex(len(song_database))
+for col in feature_cols:
+    buckets = np.minimum((feature_values[col] * FEATURE_BUCKETS).astype(int), FEATURE_BUCKETS - 1)
+    for bucket in range(FEATURE_BUCKETS):
+        feature_bucket_index.add_mask((col, bucket), buckets == bucket)
+
+print(f"Built bitmap indexes: {len(genre_index)} genres, {len(artist_index)} artists, "
+      f"{len(feature_bucket_index)} feature buckets")
+
+# L2-normalized feature vectors per song position, used for vectorized scoring and re-ranking
+feature_matrix = df_clean[all_feature_cols].values.astype(float)
+feature_norms = np.linalg.norm(feature_matrix, axis=1, keepdims=True)
+unit_vectors = feature_matrix / np.where(feature_norms == 0, 1.0, feature_norms)
+
+
+def unit_composite(features):
+    """Composite score (danceability + energy + valence average) of the L2-normalized features"""
+    features = np.asarray(features, dtype=float)
+    norm = np.linalg.norm(features)
+    if norm == 0:
+        return 0.0
+    return float(features[0] + features[1] + features[9]) / (3.0 * norm)
+
+
+# Songs sorted by the composite score of the *unit* vectors, for streaming search: one array over
+# all songs and one per genre. On unit vectors a composite gap bounds cosine similarity (see
+# composite_bound), which lets the stream stop early; the raw composite in feature_bst gives no such bound.
+unit_composite_scores = (unit_vectors[:, 0] + unit_vectors[:, 1] + unit_vectors[:, 9]) / 3.0
+song_genres = df_clean[genre_cols].values.argmax(axis=1)
+composite_order = np.argsort(unit_composite_scores, kind="stable")
+# (sorted unit composite scores, song positions in that order), overall and per genre
+unit_composite_order = (unit_composite_scores[composite_order], composite_order)
+genre_composite_orders = {}
+genre_sizes = np.bincount(song_genres, minlength=len(genre_cols))
+for genre in np.unique(song_genres):
+    order = composite_order[song_genres[composite_order] == genre]
+    genre_composite_orders[genre] = (unit_composite_scores[order], order)
+
+# Songs of different genres share no genre column, so their cosine similarity is at most the product
+# of their audio-feature norm ratios |audio| / |all features|
+audio_norm_ratios = (np.linalg.norm(feature_matrix[:, :len(feature_cols)], axis=1)
+                     / np.where(feature_norms[:, 0] == 0, 1.0, feature_norms[:, 0]))
+max_audio_norm_ratio = float(audio_norm_ratios.max())
+
 # Initialize song predictor
 song_predictor = SongPredictor(song_database)
 
@@ -80,6 +209,13 @@ app = FastAPI(title="MelodyMatchr API",
               version="0.1")
 
 
+# On-demand profiler for the search handlers, armed through the /admin/profile endpoints
+request_profiler = RequestProfiler()
+
+# Admin endpoints are disabled unless this token is set; clients send it as X-Admin-Token
+ADMIN_TOKEN = os.environ.get("MELODYMATCHR_ADMIN_TOKEN")
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -134,9 +270,29 @@ class SongModel(BaseModel):
     features: List[float]
 
 
+class FeatureRange(BaseModel):
+    # Bounds are in the feature's original units (e.g. tempo in BPM)
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
 class SearchRequest(BaseModel):
     song_name: str
     top_k: Optional[int] = 3
+    # Optional filters, applied before scoring
+    genres: Optional[List[str]] = None
+    exclude_genres: Optional[List[str]] = None
+    artists: Optional[List[str]] = None
+    exclude_artists: Optional[List[str]] = None
+    exclude_same_artist: Optional[bool] = False
+    feature_ranges: Optional[Dict[str, FeatureRange]] = None
+    # 0 = rank purely by similarity, 1 = favour songs unlike those already picked
+    diversity: Optional[float] = 0.0
+    max_per_artist: Optional[int] = None
+    # Pagination: return page_size matches plus a next_cursor for /search/page
+    page_size: Optional[int] = None
+    # Compact mode returns parallel arrays of ids and similarities instead of match objects
+    compact: Optional[bool] = False
 
 def to_internal_song(m: SongModel) -> SongClass:
     return SongClass(song_id=m.id, name=m.name or "", artist=m.artist or "", features=m.features)
@@ -150,93 +306,304 @@ class PredictRequest(BaseModel):
     tolerance: Optional[float] = 0.1
     top_k: Optional[int] = 5
 
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
+class PageRequest(BaseModel):
+    cursor: str
+    page_size: Optional[int] = None
+    compact: Optional[bool] = False
 
+class ProfileRequest(BaseModel):
+    # The window closes after duration_s seconds or max_requests requests, whichever comes first
+    duration_s: Optional[float] = 30.0
+    max_requests: Optional[int] = None
+    sample_interval_ms: Optional[float] = 5.0
 
-## HashTable Search Endpoint
-@app.post("/search/hashtable")
-async def search_hashtable(req: SearchRequest):
+## Filtered search helpers ##
+
+def _feature_bucket(value):
+    return min(max(int(value * FEATURE_BUCKETS), 0), FEATURE_BUCKETS - 1)
+
+
+def feature_range_bitmap(col, min_value=None, max_value=None):
     """
-    Search for a song by name and return top K similar songs from the database.
-    Uses HashTable-based matching for faster top-k retrieval.
-    
-    Supports format: "Song Name" or "Song Name - Artist Name"
+    Bitmap of songs whose feature `col` lies in [min_value, max_value].
+    Bounds are given in original units and mapped onto the 0-1 scale used by the scaler.
     """
-    
-    query = req.song_name.strip()
+    col_idx = all_feature_cols.index(col)
+    data_min = scaler.data_min_[col_idx]
+    data_range = scaler.data_range_[col_idx] or 1.0
+    lo = 0.0 if min_value is None else (min_value - data_min) / data_range
+    hi = 1.0 if max_value is None else (max_value - data_min) / data_range
+    if lo > hi or hi < 0.0 or lo > 1.0:
+        return feature_bucket_index.empty()
 
-    if not query:
-        raise HTTPException(status_code=400, detail="Song name cannot be empty")
+    lo_bucket, hi_bucket = _feature_bucket(lo), _feature_bucket(hi)
 
-    # Use smart finder to handle duplicates
-    target_song = find_song_smart(query, song_database, song_name_bst)
+    # Buckets strictly inside the range match as a whole
+    inner = feature_bucket_index.any_of((col, b) for b in range(lo_bucket + 1, hi_bucket))
 
-    if not target_song:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"Song '{req.song_name}' not found in database. Try format: 'Song Name - Artist Name'"
-        )
+    # Edge buckets may only partially overlap the range, so check exact values there
+    edge_positions = feature_bucket_index.to_positions(
+        feature_bucket_index.any_of({(col, lo_bucket), (col, hi_bucket)}))
+    edge_values = feature_values[col][edge_positions]
+    edge_mask = np.zeros(len(song_database), dtype=bool)
+    edge_mask[edge_positions[(edge_values >= lo) & (edge_values <= hi)]] = True
+
+    return np.bitwise_or(inner, np.packbits(edge_mask))
+
+
+def build_filter_bitmap(req: SearchRequest, target_song):
+    """
+    Combine the request's filters into one packed bitmap over song positions.
+    Returns None when the request has no filters.
+    """
+    bitmap = None
+
+    def restrict(other):
+        nonlocal bitmap
+        bitmap = other if bitmap is None else np.bitwise_and(bitmap, other)
+
+    def exclude(other):
+        nonlocal bitmap
+        base = BitmapIndex.full_bitmap(len(song_database)) if bitmap is None else bitmap
+        bitmap = np.bitwise_and(base, np.bitwise_not(other))
+
+    for genres in (req.genres, req.exclude_genres):
+        unknown = [g for g in genres or [] if g.strip().lower() not in genre_index]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown genre(s): {', '.join(unknown)}")
+
+    unknown = [a for a in req.artists or [] if a.strip().lower() not in artist_index]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown artist(s): {', '.join(unknown)}")
+
+    if req.genres:
+        restrict(genre_index.any_of(g.strip().lower() for g in req.genres))
+    if req.exclude_genres:
+        exclude(genre_index.any_of(g.strip().lower() for g in req.exclude_genres))
+    if req.artists:
+        restrict(artist_index.any_of(a.strip().lower() for a in req.artists))
+
+    excluded_artists = [a.strip().lower() for a in req.exclude_artists or []]
+    if req.exclude_same_artist:
+        excluded_artists += [a.strip().lower() for a in target_song.artist.split(';')]
+    if excluded_artists:
+        exclude(artist_index.any_of(excluded_artists))
+
+    for col, bounds in (req.feature_ranges or {}).items():
+        if col not in feature_cols:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown feature '{col}'. Filterable features: {', '.join(feature_cols)}"
+            )
+        restrict(feature_range_bitmap(col, bounds.min, bounds.max))
+
+    return bitmap
+
+
+def candidate_stream(target_song, filter_bitmap=None):
+    """
+    Generator of (similarity_upper_bound, positions) blocks for SongMatcherStreaming, with
+    non-increasing bounds. Walks outward from the target's unit composite score, first through the
+    target's own genre and then through the other genres, dropping the target and songs excluded
+    by the filter bitmap. Nothing is materialized up front.
+    """
+    allowed = None if filter_bitmap is None else BitmapIndex.bitmap_to_mask(filter_bitmap, len(song_database))
+    key = unit_composite(target_song.features)
+    genre = song_genres[target_song.index]
+    other_genre_bound = audio_norm_ratios[target_song.index] * max_audio_norm_ratio
+
+    def keep(positions):
+        positions = positions[positions != target_song.index]
+        return positions if allowed is None else positions[allowed[positions]]
+
+    # Songs still to come from other genres can reach other_genre_bound, so it floors the bound here
+    genre_keys, genre_positions = genre_composite_orders[genre]
+    for distance, indices in outward_blocks(genre_keys, key):
+        yield max(composite_bound(distance), other_genre_bound), keep(genre_positions[indices])
 
+    all_keys, all_positions = unit_composite_order
+    for distance, indices in outward_blocks(all_keys, key):
+        positions = all_positions[indices]
+        yield min(composite_bound(distance), other_genre_bound), keep(positions[song_genres[positions] != genre])
+
+
+# Filters letting at most this many songs through skip the composite window and score every allowed song
+FILTERED_FULL_SCAN_LIMIT = 5000
+
+
+def find_candidates(target_song, filter_bitmap=None):
+    """
+    Candidate songs within a composite-score window around the target, excluding the target.
+    Without filters the window is taken from the feature BST. With filters the bitmap is
+    resolved first: a selective filter returns every allowed song, otherwise only the allowed
+    songs inside the window are kept.
+    """
     # Calculate target song's composite score
     target_composite = (target_song.features[0] + target_song.features[1] + target_song.features[9]) / 3.0
 
-    # Use BST range_search to filter candidates within similar feature range
-    range_tolerance = 0.2
-    min_score = max(0.0, target_composite - range_tolerance)
-    max_score = min(1.0, target_composite + range_tolerance)
-
-    # Get candidate songs using BST range search
-    candidates = feature_bst.range_search(min_score, max_score)
+    allowed = None
+    if filter_bitmap is not None:
+        allowed = BitmapIndex.bitmap_to_positions(filter_bitmap, len(song_database))
+        allowed = allowed[allowed != target_song.index]
 
-    # Remove target song from candidates if present
-    candidates = [song for song in candidates if song.id != target_song.id]
+        # Few enough songs pass the filter to score them all; the window would only drop matches
+        if len(allowed) <= FILTERED_FULL_SCAN_LIMIT:
+            return [song_database[pos] for pos in allowed]
 
-    # If we didn't get enough candidates from range search, expand range
-    if len(candidates) < 100:
-        range_tolerance = 0.4
+    # Only search songs within ±0.2 (chosen after testing different values) of target's composite score.
+    # If we didn't get enough candidates from range search, expand range to ±0.4
+    for range_tolerance in (0.2, 0.4):
         min_score = max(0.0, target_composite - range_tolerance)
         max_score = min(1.0, target_composite + range_tolerance)
-        candidates = feature_bst.range_search(min_score, max_score)
-        candidates = [song for song in candidates if song.id != target_song.id]
 
-    top_k = max(1, int(req.top_k or 3))
+        if allowed is None:
+            # Get candidate songs using BST range search (much faster than full scan)
+            candidates = feature_bst.range_search(min_score, max_score)
+            # Remove target song from candidates if present
+            candidates = [song for song in candidates if song.id != target_song.id]
+        else:
+            scores = composite_scores[allowed]
+            in_range = allowed[(scores >= min_score) & (scores <= max_score)]
+            candidates = [song_database[pos] for pos in in_range]
+
+        if len(candidates) >= 100:
+            break
+
+    return candidates
+
+
+## Diversity re-ranking helpers ##
+
+# When diversifying, re-rank a pool of DIVERSITY_POOL_FACTOR * top_k best matches,
+# at least MIN_DIVERSITY_POOL and (beyond top_k itself) at most MAX_DIVERSITY_POOL
+DIVERSITY_POOL_FACTOR = 5
+MIN_DIVERSITY_POOL = 50
+MAX_DIVERSITY_POOL = 500
+# MMR costs O(pool * top_k) vector ops, so diversity > 0 is only accepted up to this top_k
+MAX_DIVERSITY_TOP_K = 500
 
-    # Use SongMatcherHashTable class from song_similarity.py on filtered candidates
-    matcher = SongMatcherHashTable(target_song, candidates)
-    results = matcher.match(top_k=top_k)
-
-    # Format results
-    matches = []
-    for similarity, song in results:
-        matches.append({
-            "id": song.id,
-            "name": song.name,
-            "artist": song.artist,
-            "similarity": similarity
-        })
+
+def diversity_pool_size(req: SearchRequest, top_k):
+    """How many top matches to score before re-ranking (just top_k when not diversifying)"""
+    if req.diversity is not None and not 0.0 <= req.diversity <= 1.0:
+        raise HTTPException(status_code=400, detail="diversity must be between 0 and 1")
+    if req.max_per_artist is not None and req.max_per_artist < 1:
+        raise HTTPException(status_code=400, detail="max_per_artist must be at least 1")
+    if req.diversity and top_k > MAX_DIVERSITY_TOP_K:
+        raise HTTPException(status_code=400, detail=f"diversity is supported for top_k up to {MAX_DIVERSITY_TOP_K}")
+
+    if not req.diversity and not req.max_per_artist:
+        return top_k
+    pool_size = max(top_k * DIVERSITY_POOL_FACTOR, MIN_DIVERSITY_POOL)
+    return max(top_k, min(pool_size, MAX_DIVERSITY_POOL))
+
+
+def diversify(req: SearchRequest, results, top_k):
+    """MMR / artist-cap re-ranking of (similarity, song) results sorted by similarity"""
+    if not req.diversity and not req.max_per_artist:
+        return results
+    reranker = DiversityReranker(unit_vectors, diversity=req.diversity or 0.0,
+                                 max_per_artist=req.max_per_artist)
+    return reranker.rerank(results, top_k=top_k)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/songs/{track_id}/duplicates")
+async def song_duplicates(track_id: str):
+    """
+    Return the canonical track for a track id and every near-duplicate collapsed into it.
+    """
+    canonical_id = duplicate_of.get(track_id, track_id)
+    canonical = song_by_id.get(canonical_id)
+
+    if not canonical:
+        raise HTTPException(status_code=404, detail=f"Track '{track_id}' not found in database")
 
     return {
-        "searched_song": {
-            "id": target_song.id,
-            "name": target_song.name,
-            "artist": target_song.artist
+        "canonical": {
+            "id": canonical.id,
+            "name": canonical.name,
+            "artist": canonical.artist
         },
-        "matches": matches
+        "duplicates": duplicate_groups.get(canonical_id, [])
     }
 
 
-## MinHeap Search Endpoint
-@app.post("/search")
-async def search(req: SearchRequest):
+## Large result helpers ##
+
+# Largest top_k a client can ask for; page through it with page_size / cursors
+MAX_TOP_K = 5000
+MAX_PAGE_SIZE = 500
+# Above this many matches, scoring switches from the heap / hash table to a vectorized partial sort
+PARTIAL_SORT_MIN_K = 100
+# Streaming search is used only when at least this fraction of the catalog passes the filter
+STREAM_MIN_ALLOWED_FRACTION = 0.5
+# The stream touches about the target's genre, the partial sort the whole catalog, but a streamed
+# song costs roughly this many times a row of the full matrix-vector product (measured), so
+# streaming only wins when the genre is smaller than 1 / STREAM_COST_FACTOR of the catalog
+STREAM_COST_FACTOR = 20
+
+# Ranked results kept for cursor pagination: result id -> (searched_song, results, page_size)
+ranked_results_cache = LRUCache(max_size=256, ttl_s=600)
+
+
+def fast_json_response(payload):
+    """Serialize straight to bytes, skipping FastAPI's jsonable_encoder pass over every match"""
+    if orjson is not None:
+        return Response(content=orjson.dumps(payload), media_type="application/json")
+    return Response(content=json.dumps(payload, separators=(",", ":")), media_type="application/json")
+
+
+def validate_page_size(page_size):
+    if page_size is not None and not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+
+
+def page_response(searched_song, results, offset=0, page_size=None, compact=False, result_id=None):
     """
-    Search for a song by name and return top K similar songs from the database.
-    Uses MinHeap-based matching for memory-efficient top-k retrieval.
-    
-    Supports format: "Song Name" or "Song Name - Artist Name"
+    Format one page of ranked (similarity, song) results.
+    When paginating, the first page caches the ranked results and every page returns a next_cursor.
     """
+    page = results[offset:offset + page_size] if page_size else results[offset:]
+
+    if compact:
+        matches = {
+            "ids": [song.id for _, song in page],
+            "similarities": [float(similarity) for similarity, _ in page]
+        }
+    else:
+        matches = [
+            {
+                "id": song.id,
+                "name": song.name,
+                "artist": song.artist,
+                "similarity": float(similarity)
+            }
+            for similarity, song in page
+        ]
+
+    payload = {"searched_song": searched_song, "matches": matches}
+
+    if page_size:
+        next_offset = offset + len(page)
+        if result_id is None and next_offset < len(results):
+            result_id = secrets.token_urlsafe(12)
+            ranked_results_cache.put(result_id, (searched_song, results, page_size))
+        payload["total"] = len(results)
+        payload["next_cursor"] = f"{result_id}.{next_offset}" if next_offset < len(results) else None
+
+    return fast_json_response(payload)
+
 
+def run_search(req: SearchRequest, matcher_class):
+    """
+    Shared body of the search endpoints: find the target song, gather filtered candidates,
+    score them with matcher_class and return the top K matches (first page if paginating).
+    """
     query = req.song_name.strip()
 
     if not query:
@@ -251,53 +618,102 @@ async def search(req: SearchRequest):
             detail=f"Song '{req.song_name}' not found in database. Try format: 'Song Name - Artist Name'"
         )
 
-    # Calculate target song's composite score
-    target_composite = (target_song.features[0] + target_song.features[1] + target_song.features[9]) / 3.0
+    # Filters are resolved to a bitmap before any scoring happens
+    filter_bitmap = build_filter_bitmap(req, target_song)
 
-    # Use BST range_search to filter candidates within similar feature range
-    # Only search songs within ±0.2 (chosen after testing different values) of target's composite score
-    range_tolerance = 0.2
-    min_score = max(0.0, target_composite - range_tolerance)
-    max_score = min(1.0, target_composite + range_tolerance)
+    top_k = max(1, int(req.top_k or 3))
+    if top_k > MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be at most {MAX_TOP_K}; use page_size to page through results")
+    validate_page_size(req.page_size)
+    pool_size = min(diversity_pool_size(req, top_k), MAX_TOP_K)
+
+    # The candidate set depends only on the endpoint, never on top_k, so raising top_k or paging
+    # can't change the head of the ranking; top_k only picks the scoring strategy.
+    if matcher_class is SongMatcherStreaming:
+        # /search ranks exactly over every allowed song: streaming for small K when the target's genre
+        # is a small slice of the catalog, and a vectorized partial sort otherwise. The stream only
+        # stops early once the target's own genre has filled the top K, so filters that are
+        # selective or leave out most of that genre don't stream.
+        allowed = None if filter_bitmap is None else BitmapIndex.bitmap_to_positions(filter_bitmap, len(song_database))
+        target_genre = song_genres[target_song.index]
+        use_stream = (pool_size <= PARTIAL_SORT_MIN_K
+                      and STREAM_COST_FACTOR * genre_sizes[target_genre] < len(song_database)) and (
+            allowed is None or (
+                len(allowed) >= STREAM_MIN_ALLOWED_FRACTION * len(song_database)
+                and np.count_nonzero(song_genres[allowed] == target_genre) > pool_size
+            ))
+        if use_stream:
+            # Pulls candidates lazily and stops once none can beat the current top K
+            matcher = SongMatcherStreaming(target_song, candidate_stream(target_song, filter_bitmap),
+                                           song_database, unit_vectors)
+        else:
+            matcher = SongMatcherPartialSort(target_song, song_database, unit_vectors, positions=allowed)
+    else:
+        # Use the matcher class from song_similarity.py on the filtered composite-window candidates,
+        # or a vectorized partial sort over the same candidates when many matches are requested
+        candidates = find_candidates(target_song, filter_bitmap)
+        if pool_size > PARTIAL_SORT_MIN_K:
+            positions = np.fromiter((song.index for song in candidates), dtype=np.int64, count=len(candidates))
+            matcher = SongMatcherPartialSort(target_song, song_database, unit_vectors, positions=positions)
+        else:
+            matcher = matcher_class(target_song, candidates)
+    results = matcher.match(top_k=pool_size)
+
+    # Re-rank the pool for diversity (no-op unless diversity / max_per_artist is set)
+    results = diversify(req, results, top_k)
+
+    searched_song = {
+        "id": target_song.id,
+        "name": target_song.name,
+        "artist": target_song.artist
+    }
+    return page_response(searched_song, results, page_size=req.page_size, compact=req.compact)
 
-    # Get candidate songs using BST range search (much faster than full scan)
-    candidates = feature_bst.range_search(min_score, max_score)
 
-    # Remove target song from candidates if present
-    candidates = [song for song in candidates if song.id != target_song.id]
+## HashTable Search Endpoint
+@app.post("/search/hashtable")
+async def search_hashtable(req: SearchRequest):
+    """
+    Search for a song by name and return top K similar songs from the database.
+    Uses HashTable-based matching for faster top-k retrieval.
+    
+    Supports format: "Song Name" or "Song Name - Artist Name"
+    """
+    if request_profiler.armed:
+        return request_profiler.run(run_search, req, SongMatcherHashTable)
+    return run_search(req, SongMatcherHashTable)
 
-    # If we didn't get enough candidates from range search, expand range
-    if len(candidates) < 100:
-        range_tolerance = 0.4
-        min_score = max(0.0, target_composite - range_tolerance)
-        max_score = min(1.0, target_composite + range_tolerance)
-        candidates = feature_bst.range_search(min_score, max_score)
-        candidates = [song for song in candidates if song.id != target_song.id]
 
-    top_k = max(1, int(req.top_k or 3))
+## MinHeap Search Endpoint
+@app.post("/search")
+async def search(req: SearchRequest):
+    """
+    Search for a song by name and return top K similar songs from the database.
+    Streams candidates outward from the target's composite score in vectorized blocks,
+    stopping as soon as no remaining song can make the top K.
+    
+    Supports format: "Song Name" or "Song Name - Artist Name"
+    """
+    if request_profiler.armed:
+        return request_profiler.run(run_search, req, SongMatcherStreaming)
+    return run_search(req, SongMatcherStreaming)
 
-    # Use SongMatcher class from song_similarity.py on filtered candidates
-    matcher = SongMatcher(target_song, candidates)
-    results = matcher.match(top_k=top_k)
-
-    # Format results
-    matches = []
-    for similarity, song in results:
-        matches.append({
-            "id": song.id,
-            "name": song.name,
-            "artist": song.artist,
-            "similarity": similarity
-        })
 
-    return {
-        "searched_song": {
-            "id": target_song.id,
-            "name": target_song.name,
-            "artist": target_song.artist
-        },
-        "matches": matches
-    }
+@app.post("/search/page")
+async def search_page(req: PageRequest):
+    """
+    Return the next page of a paginated search, using the next_cursor of the previous page.
+    """
+    result_id, _, offset = req.cursor.rpartition(".")
+    entry = ranked_results_cache.get(result_id) if offset.isdigit() else None
+
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Cursor is invalid or expired; repeat the search")
+
+    validate_page_size(req.page_size)
+    searched_song, results, page_size = entry
+    return page_response(searched_song, results, offset=int(offset), page_size=req.page_size or page_size,
+                         compact=req.compact, result_id=result_id)
 
 
 @app.post("/search/prefix")
@@ -347,6 +763,75 @@ async def predict_similar_songs(req: PredictRequest):
     }
 
 
+## Admin Profiling Endpoints
+
+# Longest profiling window an admin can request
+MAX_PROFILE_DURATION_S = 300.0
+PROFILE_SORT_KEYS = ("cumulative", "tottime", "calls")
+
+
+def require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.post("/admin/profile/start")
+async def start_profile(req: ProfileRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Profile the search handlers for the next max_requests requests and/or duration_s seconds.
+    """
+    require_admin(x_admin_token)
+
+    if not req.duration_s and not req.max_requests:
+        raise HTTPException(status_code=400, detail="Set duration_s and/or max_requests to bound the window")
+    if req.duration_s and not 0 < req.duration_s <= MAX_PROFILE_DURATION_S:
+        raise HTTPException(status_code=400, detail=f"duration_s must be between 0 and {MAX_PROFILE_DURATION_S}")
+    if req.max_requests is not None and req.max_requests < 1:
+        raise HTTPException(status_code=400, detail="max_requests must be at least 1")
+
+    request_profiler.start(
+        duration_s=req.duration_s,
+        max_requests=req.max_requests,
+        sample_interval_ms=max(1.0, req.sample_interval_ms or 5.0)
+    )
+    return {"status": "profiling", "duration_s": req.duration_s, "max_requests": req.max_requests}
+
+
+@app.post("/admin/profile/stop")
+async def stop_profile(x_admin_token: Optional[str] = Header(None)):
+    """
+    Close the profiling window early and return its results.
+    """
+    require_admin(x_admin_token)
+    request_profiler.stop()
+    return request_profiler.results()
+
+
+@app.get("/admin/profile")
+async def profile_results(limit: int = 30, sort_by: str = "cumulative",
+                          x_admin_token: Optional[str] = Header(None)):
+    """
+    Aggregated cProfile stats and collapsed stacks of the current or last profiling window.
+    """
+    require_admin(x_admin_token)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    if sort_by not in PROFILE_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(PROFILE_SORT_KEYS)}")
+    return request_profiler.results(limit=limit, sort_by=sort_by)
+
+
+@app.get("/admin/profile/collapsed", response_class=PlainTextResponse)
+async def profile_collapsed(x_admin_token: Optional[str] = Header(None)):
+    """
+    Collapsed stacks as plain text, ready for flamegraph.pl or speedscope.
+    """
+    require_admin(x_admin_token)
+    return request_profiler.collapsed()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,5 +1,11 @@
 ## The Data structures for MelodyMatchr
 
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
 class MinHeap:
 
     def __init__(self, max_size=10):
@@ -194,6 +200,43 @@ def binary_search_range(sorted_array, min_val, max_val, key_func=lambda x: x):
 
     return sorted_array[start_idx:end_idx]
 
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, highest first.
+    Partial sort: np.argpartition selects the top k in O(n), then only those k are sorted.
+    Time: O(n + k log k) instead of O(n log k) pushes through a heap
+    """
+    scores = np.asarray(scores, dtype=float)
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def outward_blocks(sorted_keys, key, first_block=32, max_block=2048):
+    """
+    Walk a sorted NumPy key array outward from key in both directions, in blocks that double in
+    size up to max_block. Yields (distance, indices): distance is the smallest |sorted_keys[i] - key|
+    among this block and every later block, so it bounds everything not yet visited.
+    Memory: O(max_block) regardless of how far the walk goes
+    """
+    n = len(sorted_keys)
+    lo = hi = int(np.searchsorted(sorted_keys, key))
+    block = first_block
+
+    while lo > 0 or hi < n:
+        left_distance = key - sorted_keys[lo - 1] if lo > 0 else np.inf
+        right_distance = sorted_keys[hi] - key if hi < n else np.inf
+
+        new_lo, new_hi = max(0, lo - block), min(n, hi + block)
+        yield min(left_distance, right_distance), np.r_[new_lo:lo, hi:new_hi]
+
+        lo, hi = new_lo, new_hi
+        block = min(block * 2, max_block)
+
+
 #Added For improved search functionality **(optional)** DELETE or FIX if broken
 
 class TrieNode:
@@ -301,3 +344,165 @@ class HashTableTopK:
     def __len__(self):
         # num items in hash table
         return self.size
+
+
+# Bitmap Index for filtered search
+class BitmapIndex:
+    # Maps a key (genre, artist, feature bucket, ...) to the set of song positions
+    # that have it. Like a roaring bitmap, each key picks its own container:
+    #   - dense keys are stored as packed bits (np.packbits), 1 bit per song
+    #   - sparse keys are stored as sorted position arrays
+    # Queries combine keys with bitwise AND / OR on packed bitmaps.
+    # Time Complexity:
+      # - Lookup: O(n / 8) for dense keys, O(m) for sparse keys with m positions
+      # - AND / OR: O(n / 8) - one vectorized op over packed bytes
+    # Space Complexity: O(n / 8) per dense key, O(m) per sparse key
+
+    # Keys holding fewer than 1/16 of all songs are kept as position arrays
+    SPARSE_RATIO = 16
+
+    def __init__(self, size):
+        self.size = size
+        self.containers = {}
+
+    def add(self, key, positions):
+        """Index a key with the song positions (array of ints) that have it"""
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        if len(positions) * self.SPARSE_RATIO < self.size:
+            self.containers[key] = positions
+        else:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[positions] = True
+            self.containers[key] = np.packbits(mask)
+
+    def add_mask(self, key, mask):
+        """Index a key from a boolean mask over all song positions"""
+        self.add(key, np.flatnonzero(mask))
+
+    def get(self, key):
+        """Return the packed bitmap for a key (all zeros if the key is unknown)"""
+        container = self.containers.get(key)
+        if container is None:
+            return self.empty()
+        if container.dtype == np.uint8:
+            return container
+        mask = np.zeros(self.size, dtype=bool)
+        mask[container] = True
+        return np.packbits(mask)
+
+    def any_of(self, keys):
+        """OR together the bitmaps of several keys"""
+        result = self.empty()
+        for key in keys:
+            result = np.bitwise_or(result, self.get(key))
+        return result
+
+    def empty(self):
+        return BitmapIndex.empty_bitmap(self.size)
+
+    def to_positions(self, bitmap):
+        return BitmapIndex.bitmap_to_positions(bitmap, self.size)
+
+    # Packed-bitmap helpers, usable on any bitmap over `size` songs (e.g. a combined filter)
+
+    @staticmethod
+    def empty_bitmap(size):
+        return np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    @staticmethod
+    def full_bitmap(size):
+        return np.packbits(np.ones(size, dtype=bool))
+
+    @staticmethod
+    def bitmap_to_mask(bitmap, size):
+        """Unpack a packed bitmap back into a boolean mask of length size"""
+        return np.unpackbits(bitmap, count=size).astype(bool)
+
+    @staticmethod
+    def bitmap_to_positions(bitmap, size):
+        return np.flatnonzero(BitmapIndex.bitmap_to_mask(bitmap, size))
+
+    def __contains__(self, key):
+        return key in self.containers
+
+    def __len__(self):
+        return len(self.containers)
+
+
+# Locality-Sensitive Hashing for cosine similarity
+class SimHashLSH:
+    # Random-hyperplane SimHash: each vector gets num_bits sign bits, one per random
+    # hyperplane. Two vectors agree on a bit with probability 1 - angle / pi, so
+    # near-identical vectors share most bits.
+    # The bits are split into num_bands bands; vectors agreeing on a whole band land in
+    # the same bucket, which finds similar pairs without comparing every pair.
+    # Time Complexity:
+      # - Hashing: O(n * d * num_bits) as one matrix product
+      # - Bucketing: O(n * num_bands) average
+    # Space Complexity: O(n * num_bands)
+
+    def __init__(self, dim, num_bits=32, num_bands=4, seed=42):
+        if num_bits % num_bands != 0:
+            raise ValueError("num_bits must be a multiple of num_bands")
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((dim, num_bits))
+        self.num_bands = num_bands
+        self.band_bits = num_bits // num_bands
+
+    def signatures(self, vectors):
+        """Sign bits of each vector against every hyperplane, shape (n, num_bits)"""
+        return np.asarray(vectors, dtype=float) @ self.planes >= 0
+
+    def band_keys(self, vectors):
+        """Each band of the signature packed into one integer, shape (n, num_bands)"""
+        bits = self.signatures(vectors).reshape(len(vectors), self.num_bands, self.band_bits)
+        weights = np.left_shift(1, np.arange(self.band_bits, dtype=np.int64))
+        return bits.astype(np.int64) @ weights
+
+    def buckets(self, vectors, prefixes=None):
+        """
+        Group positions by (prefix, band, band key). Only buckets with 2+ members are returned.
+        prefixes optionally narrows buckets further, e.g. to songs with the same title.
+        """
+        keys = self.band_keys(vectors)
+        table = {}
+        for pos, row in enumerate(keys.tolist()):
+            prefix = prefixes[pos] if prefixes is not None else None
+            for band, key in enumerate(row):
+                table.setdefault((prefix, band, key), []).append(pos)
+        return [members for members in table.values() if len(members) > 1]
+
+
+# LRU cache for ranked results (pagination cursors)
+class LRUCache:
+    # Least-recently-used cache with optional time-to-live, backed by an OrderedDict.
+    # Time Complexity: O(1) get / put
+    # Space Complexity: O(max_size)
+
+    def __init__(self, max_size=128, ttl_s=None):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()  # key -> (stored_at, value)
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, value = entry
+        if self.ttl_s is not None and time.monotonic() - stored_at > self.ttl_s:
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
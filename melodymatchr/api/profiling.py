@@ -0,0 +1,152 @@
+## On-demand profiling for MelodyMatchr
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+class RequestProfiler:
+
+    # Profiles the next N requests and/or a bounded time window on a live worker.
+    #   - cProfile gives aggregated per-function stats (calls, total / cumulative time)
+    #   - a sampling thread records the stack of the request being served every few ms,
+    #     which becomes collapsed-stack output ("a;b;c 12") for flamegraph tools
+    # When not armed, handlers only check `armed` and run unprofiled, and no thread exists.
+
+    def __init__(self):
+        self.armed = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self.profile = cProfile.Profile()
+        self.collapsed_stacks = {}
+        self.requests_profiled = 0
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.deadline = None
+        self.remaining_requests = None
+        self.sample_interval = 0.005
+        self._active_thread = None
+
+    def start(self, duration_s=None, max_requests=None, sample_interval_ms=5.0):
+        """Start a new profiling window, discarding results of the previous one"""
+        with self._lock:
+            # Each window gets its own stop event so a previous sampler thread can't keep running
+            self._stop_event.set()
+            self.armed = False
+            self._reset()
+            self._stop_event = threading.Event()
+            self.started_at = time.time()
+            self.deadline = self.started_at + duration_s if duration_s else None
+            self.remaining_requests = max_requests
+            self.sample_interval = sample_interval_ms / 1000.0
+            sampler = threading.Thread(target=self._sample_loop, args=(self._stop_event,),
+                                       name="request-profiler", daemon=True)
+            self.armed = True
+            sampler.start()
+
+    def stop(self):
+        self._stop_window(self._stop_event)
+
+    def _stop_window(self, stop_event):
+        """Close the window owning stop_event; a no-op if a newer window has started since"""
+        with self._lock:
+            stop_event.set()
+            if stop_event is self._stop_event and self.armed:
+                self.armed = False
+                self.stopped_at = time.time()
+
+    def _expired(self):
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.remaining_requests is not None and self.remaining_requests <= 0
+
+    def run(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) under the profiler if the window is still open"""
+        if self._expired():
+            self.stop()
+        if not self.armed:
+            return func(*args, **kwargs)
+
+        self._active_thread = threading.get_ident()
+        self.profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profile.disable()
+            self._active_thread = None
+            self.requests_profiled += 1
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self._expired():
+                self.stop()
+
+    def _sample_loop(self, stop_event):
+        while not stop_event.wait(self.sample_interval):
+            if self._expired():
+                # Only ever closes this sampler's own window, never one started after it
+                self._stop_window(stop_event)
+                break
+
+            thread_id = self._active_thread
+            if thread_id is None:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+
+            # Walk up to (but not including) RequestProfiler.run so stacks start at the handler
+            stack = []
+            while frame is not None and frame.f_code is not RequestProfiler.run.__code__:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.collapsed_stacks[key] = self.collapsed_stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed stacks, one "frame;frame;frame count" line each (flamegraph.pl / speedscope input)"""
+        lines = [f"{stack} {count}" for stack, count in
+                 sorted(self.collapsed_stacks.items(), key=lambda item: item[1], reverse=True)]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def results(self, limit=30, sort_by="cumulative"):
+        """Aggregated cProfile stats for everything profiled in the current window"""
+        top_functions = []
+        stats_text = ""
+
+        if self.requests_profiled:
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats(sort_by).print_stats(limit)
+            stats_text = stream.getvalue()
+
+            for (filename, line, func), (_, calls, total, cumulative, _) in stats.stats.items():
+                top_functions.append({
+                    "function": f"{os.path.basename(filename)}:{line}({func})",
+                    "calls": calls,
+                    "total_time": total,
+                    "cumulative_time": cumulative
+                })
+            key = {"tottime": "total_time", "calls": "calls"}.get(sort_by, "cumulative_time")
+            top_functions.sort(key=lambda f: f[key], reverse=True)
+            top_functions = top_functions[:limit]
+
+        return {
+            "active": self.armed,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "requests_profiled": self.requests_profiled,
+            "samples": self.samples,
+            "top_functions": top_functions,
+            "stats": stats_text,
+            "collapsed_stacks": self.collapsed()
+        }
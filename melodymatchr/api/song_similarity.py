@@ -1,20 +1,24 @@
 
 
 import math
+import re
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from data_structures import MinHeap, BST, HashTableTopK
+from data_structures import MinHeap, BST, HashTableTopK, SimHashLSH, top_k_indices
+
+# Classes taking `unit_vectors` expect the L2-normalized feature matrix, one row per Song.index
 
 
 class Song:
 
-    def __init__(self, song_id, name, artist, features):
+    def __init__(self, song_id, name, artist, features, index=None):
         self.id = song_id
         self.name = name
         self.artist = artist
         self.features = features
+        self.index = index  # position in song_database, used by the bitmap indexes
 
     def __repr__(self):
         return f"Song('{self.name}' by {self.artist})"
@@ -79,6 +83,224 @@ class SongMatcherHashTable:
     
 # END Implement HashTable version (We don't need to implement HashTable version for the Predictor) #
 
+class SongMatcherPartialSort:
+
+    # Vectorized implementation for large top_k.
+    # Scores the whole catalog (or the allowed positions of a filter) in one matrix-vector product
+    # against precomputed unit vectors, then partial-sorts with np.argpartition instead of pushing
+    # n items through a heap. The target itself is never returned.
+    # Time: O(n * d + k log k), Space: O(n)
+
+    def __init__(self, target_song, song_database, unit_vectors, positions=None):
+        self.target_song = target_song
+        self.song_database = song_database
+        self.unit_vectors = unit_vectors
+        # positions: song positions allowed to match, or None for every song
+        self.positions = positions
+
+    def match(self, top_k=5):
+        target = np.asarray(self.target_song.features, dtype=float)
+        norm = np.linalg.norm(target)
+        target = target / norm if norm else target
+
+        if self.positions is None:
+            positions = np.arange(len(self.song_database))
+            scores = self.unit_vectors @ target
+        else:
+            positions = np.asarray(self.positions, dtype=np.int64)
+            if len(positions) * 4 > len(self.unit_vectors):
+                # Large allowed sets: scoring every row is cheaper than copying the selected rows
+                scores = (self.unit_vectors @ target)[positions]
+            else:
+                scores = self.unit_vectors[positions] @ target
+
+        # Push the target below every real score so it can't be picked
+        scores[positions == self.target_song.index] = -np.inf
+
+        return [(float(scores[i]), self.song_database[positions[i]])
+                for i in top_k_indices(scores, top_k) if scores[i] > -np.inf]
+
+
+def composite_bound(distance, composite_size=3):
+    """
+    Highest cosine similarity two songs can have when the composite scores of their unit feature
+    vectors (mean of composite_size coordinates) differ by distance:
+    ||u - v||^2 >= composite_size * distance^2, and cosine = 1 - ||u - v||^2 / 2
+    """
+    return 1.0 - composite_size * distance * distance / 2.0
+
+
+class SongMatcherStreaming:
+
+    # Progressive top-k over a stream of (upper_bound, positions) blocks, e.g. walking outward from
+    # the target's composite score. Each upper_bound (see composite_bound) must hold for that block
+    # and every block after it. Each block is scored with one matrix-vector product and merged into
+    # the running top k by partial sort; once the bound falls to the current k-th best score the
+    # stream is abandoned.
+    # Time: O(m * d) for the m songs actually touched, Space: O(k + block size)
+
+    def __init__(self, target_song, candidate_stream, song_database, unit_vectors):
+        self.target_song = target_song
+        self.candidate_stream = candidate_stream
+        self.song_database = song_database
+        self.unit_vectors = unit_vectors
+        self.scanned = 0
+
+    def match(self, top_k=5):
+        self.scanned = 0
+
+        target = np.asarray(self.target_song.features, dtype=float)
+        norm = np.linalg.norm(target)
+        target = target / norm if norm else target
+
+        best_scores = np.empty(0)
+        best_positions = np.empty(0, dtype=np.int64)
+
+        for upper_bound, positions in self.candidate_stream:
+            if len(best_scores) == top_k and upper_bound <= best_scores[-1]:
+                break
+            if len(positions) == 0:
+                continue
+
+            self.scanned += len(positions)
+            best_scores = np.concatenate([best_scores, self.unit_vectors[positions] @ target])
+            best_positions = np.concatenate([best_positions, positions])
+            order = top_k_indices(best_scores, top_k)
+            best_scores, best_positions = best_scores[order], best_positions[order]
+
+        return [(float(score), self.song_database[pos]) for score, pos in zip(best_scores, best_positions)]
+
+
+class DiversityReranker:
+
+    # Maximal marginal relevance (MMR) re-ranking of a pool of top candidates.
+    # Each step picks the candidate maximizing
+    #     (1 - diversity) * similarity_to_target - diversity * max_similarity_to_already_picked
+    # and then updates every candidate's max similarity with one matrix-vector product.
+    # Time: O(pool * k * d) vector ops, Space: O(pool * d)
+
+    def __init__(self, unit_vectors, diversity=0.0, max_per_artist=None):
+        self.unit_vectors = unit_vectors
+        self.diversity = diversity
+        self.max_per_artist = max_per_artist
+
+    def rerank(self, results, top_k=5):
+        """Pick top_k diverse songs from (similarity, song) results sorted by similarity"""
+        if not results:
+            return []
+
+        # Without a diversity term MMR reduces to a greedy artist-cap pass in similarity order
+        if not self.diversity:
+            return self._artist_cap(results, top_k)
+
+        relevance = np.array([sim for sim, _ in results], dtype=float)
+        pool = self.unit_vectors[[song.index for _, song in results]]
+        # Artists are grouped by primary artist, so "A" and "A;Feat X" share one cap
+        _, artist_ids = np.unique([normalize_artist(song.artist) for _, song in results], return_inverse=True)
+
+        max_sim = np.zeros(len(results))
+        available = np.ones(len(results), dtype=bool)
+        artist_counts = {}
+        picked = []
+
+        while len(picked) < top_k and available.any():
+            mmr = (1.0 - self.diversity) * relevance - self.diversity * max_sim
+            mmr[~available] = -np.inf
+            best = int(np.argmax(mmr))
+
+            picked.append(results[best])
+            available[best] = False
+            max_sim = np.maximum(max_sim, pool @ pool[best])
+
+            if self.max_per_artist:
+                artist = artist_ids[best]
+                artist_counts[artist] = artist_counts.get(artist, 0) + 1
+                if artist_counts[artist] >= self.max_per_artist:
+                    available &= artist_ids != artist
+
+        return picked
+
+    def _artist_cap(self, results, top_k):
+        if not self.max_per_artist:
+            return results[:top_k]
+
+        artist_counts = {}
+        picked = []
+        for similarity, song in results:
+            artist = normalize_artist(song.artist)
+            if artist_counts.get(artist, 0) < self.max_per_artist:
+                artist_counts[artist] = artist_counts.get(artist, 0) + 1
+                picked.append((similarity, song))
+                if len(picked) == top_k:
+                    break
+        return picked
+
+
+# Version markers that don't change which song a track is:
+# "Song (Live)", "Song [2011 Remaster]", "Song - Remastered 2011", "Song - Live at Wembley"
+_BRACKETED = re.compile(r"[\(\[].*?[\)\]]")
+_DASH_SUFFIX = re.compile(r"\s+-\s+.*$")
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize_title(title):
+    """Lowercase a track title and strip version suffixes and punctuation"""
+    title = _BRACKETED.sub(" ", title.lower())
+    title = _DASH_SUFFIX.sub("", title)
+    title = _NON_WORD.sub(" ", title)
+    return " ".join(title.split())
+
+
+def normalize_artist(artists):
+    """Lowercased primary artist of a "A;B" artist credit"""
+    return " ".join(artists.split(";")[0].lower().split())
+
+
+class NearDuplicateDetector:
+
+    # Clusters near-duplicate tracks (remasters, live versions, re-uploads) in roughly linear time.
+    # Candidate pairs must share a normalized title, a primary artist and a SimHash band of their
+    # feature vectors, so unrelated songs with generic titles ("Intro", "Home") are never merged;
+    # each candidate pair is then confirmed with exact cosine similarity and merged with union-find.
+    # Time: O(n * d * bits) hashing + O(sum of bucket_size^2) verification, Space: O(n)
+
+    def __init__(self, threshold=0.995, num_bits=32, num_bands=4, seed=42):
+        self.threshold = threshold
+        self.num_bits = num_bits
+        self.num_bands = num_bands
+        self.seed = seed
+
+    def find_groups(self, vectors, titles, artists):
+        """Return lists of positions (ascending) of tracks that are near-duplicates of each other"""
+        vectors = np.asarray(vectors, dtype=float)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        unit = vectors / np.where(norms == 0, 1.0, norms)
+
+        lsh = SimHashLSH(unit.shape[1], num_bits=self.num_bits, num_bands=self.num_bands, seed=self.seed)
+        keys = [(normalize_title(t), normalize_artist(a)) for t, a in zip(titles, artists)]
+
+        parent = list(range(len(unit)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for members in lsh.buckets(unit, prefixes=keys):
+            sims = unit[members] @ unit[members].T
+            rows, cols = np.nonzero(np.triu(sims >= self.threshold, k=1))
+            for r, c in zip(rows.tolist(), cols.tolist()):
+                root_a, root_b = find(members[r]), find(members[c])
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        groups = {}
+        for pos in range(len(unit)):
+            groups.setdefault(find(pos), []).append(pos)
+        return [members for members in groups.values() if len(members) > 1]
+
+
 # This is for the pridictive typing feature if fails DELETE or FIX 
 class SongPredictor:
     def __init__(self, song_database):